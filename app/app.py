@@ -1,53 +1,96 @@
+import atexit
 import json
+import os
+import uuid
+from concurrent.futures import Future
+from functools import partial
 
 import gradio as gr
-import numpy as np
-import plotly.express as px
-import plotly
-import plotly.graph_objects as go
-import requests
 
-from scipy.io.wavfile import write
-
-from helpers import make_header, upload_file, request_transcript, make_polling_endpoint, wait_for_completion, \
-    get_paragraphs, make_html_from_topics, make_paras_string, create_highlighted_list, make_summary, \
-    make_sentiment_output, make_entity_dict, make_entity_html, make_true_dict, make_final_json, make_content_safety_fig
+from helpers import make_header, make_paras_list, make_true_dict, make_final_json, make_sentiment_window, \
+    get_num_pages, get_page, get_highlighted_page, make_wave_fig
 
 from helpers import transcription_options_headers, audio_intelligence_headers, language_headers
 
+from css_bundle import load_css
+from jobs import JOBS, JobStore, start_pool
+from realtime import RealtimeTranscriber
+from session_store import SessionStore
+
+# Audio for all sessions, spilled to disk so session state only holds a handle
+store = SessionStore()
+atexit.register(store.close)
+
+# Number of worker processes for uploads, transcript jobs and rendering - 0 runs them in this process
+WORKERS = int(os.environ.get('AAI_WORKERS', 0))
+# Rendering jobs each worker process runs at a time
+WORKER_THREADS = int(os.environ.get('AAI_WORKER_THREADS', 4))
+# Upload and transcript jobs each worker process runs at a time - these mostly wait on AssemblyAI
+WORKER_IO_THREADS = int(os.environ.get('AAI_WORKER_IO_THREADS', 16))
+
+# Number of time bins for the sentiment/content safety timeline
+TIMELINE_BINS = 60
+
+# Number of paragraphs/utterances sent to the browser at a time
+PAGE_SIZE = 10
+
+job_store = JobStore() if WORKERS else None
+
+
+# Runs a pipeline step (a name from jobs.JOBS) on the worker pool if there is one
+def _run_job(name, *args):
+    if job_store is None:
+        return JOBS[name](*args)
+    return job_store.run(name, *args)
 
-def change_audio_source(val, plot, file_data=None, mic_data=None):
-    plot.update_traces(go.Line(y=[]))
+
+def change_audio_source(val, file_handle=None, mic_handle=None):
+    # Re-plot from the stored envelope rather than the full audio
     if val == "Audio File":
-        print("FILE DATA", file_data)
-        sample_rate, audio_data = file_data
-        plot.update_traces(go.Line(y=audio_data, x=np.arange(len(audio_data)) / sample_rate))
         return [gr.Audio.update(visible=True),
                 gr.Audio.update(visible=False),
-                gr.Plot.update(plot),
-                plot]
+                gr.Audio.update(visible=False),
+                gr.Plot.update(make_wave_fig(file_handle))]
     elif val == "Record Audio":
-        print("MIX DATA", mic_data)
-        sample_rate, audio_data = mic_data
-        plot.update_traces(go.Line(y=audio_data, x=np.arange(len(audio_data)) / sample_rate))
-
         return [gr.Audio.update(visible=False),
                 gr.Audio.update(visible=True),
-                gr.Plot.update(plot),
-                plot]
+                gr.Audio.update(visible=False),
+                gr.Plot.update(make_wave_fig(mic_handle))]
+    elif val == "Stream Audio":
+        return [gr.Audio.update(visible=False),
+                gr.Audio.update(visible=False),
+                gr.Audio.update(visible=True),
+                gr.Plot.update(make_wave_fig())]
 
 
-# Function to change saved data and plot it when audio file is input or mic is recorded
-def plot_data(audio_data, plot):
+# Send each streamed microphone chunk to the real-time endpoint and show the transcript so far
+def stream_mic(audio_chunk, api_key, transcriber):
+    # A gap in the stream means a new recording, which starts a new session with an empty transcript
+    if transcriber is None or transcriber.idle_for > transcriber.idle_timeout:
+        transcriber = RealtimeTranscriber(api_key)
+    # Reconnect mid-recording only after a normal close - after an error keep showing it until the next recording
+    elif transcriber.closed and transcriber.error is None:
+        transcriber = RealtimeTranscriber(api_key, final=transcriber.final)
+
+    if audio_chunk is not None:
+        transcriber.send(audio_chunk)
+
+    return [transcriber.text, transcriber]
+
+
+# Function to store audio when audio file is input or mic is recorded and plot it
+# Only a handle to the stored audio is kept in session state, and new audio replaces the source's previous audio
+def plot_data(audio_data, session_id, source):
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+
     if audio_data is None:
-        sample_rate, audio_data = [0, np.array([])]
-        plot.update_traces(go.Line(y=[]))
+        store.release(session_id, source)
+        handle = None
     else:
-        sample_rate, audio_data = audio_data
-        plot.update_traces(go.Line(y=audio_data, x=np.arange(len(audio_data))/sample_rate))
-
+        handle = store.put(session_id, audio_data, source)
 
-    return [gr.Plot.update(plot), [sample_rate, audio_data]]
+    return [gr.Plot.update(make_wave_fig(handle)), handle, session_id]
 
 
 # Set visibility of transcription option components when de/selected
@@ -116,15 +159,31 @@ def audint_selected(language, audio_intelligence_selector):
     return [gr.CheckboxGroup.update(selected_audint_opts), selected_audint_opts]
 
 
-def submit_to_AAI(api_key,
-                  transcription_options,
-                  audio_intelligence_selector,
-                  language,
-                  radio,
-                  audio_file,
-                  mic_recording):
-    # comment out when want to full test, for now just loading json response
-    #'''
+# Runs `fn` once per `key` in `cache` - concurrent callers with the same key wait for the same result
+def _run_once(cache, key, fn, keep=True):
+    future = Future()
+    # setdefault is atomic, so only one caller gets to run `fn`
+    existing = cache.setdefault(key, future)
+    if existing is not future:
+        return existing.result()
+
+    try:
+        future.set_result(fn())
+    except BaseException as e:
+        # Anything raised, even KeyboardInterrupt, must resolve the future or concurrent callers wait forever
+        future.set_exception(e)
+        cache.pop(key, None)
+        raise
+    finally:
+        if not keep:
+            cache.pop(key, None)
+    return future.result()
+
+
+# Upload and transcribe audio with the given options, returning the results JSON and paragraphs
+# Each audio is uploaded once per session, and identical concurrent requests share one transcript job
+def transcribe(api_key, transcription_options, audio_intelligence_selector, language, radio, file_handle,
+               mic_handle, session_id, uploads, transcripts):
     # Make request header
     header = make_header(api_key)
 
@@ -137,73 +196,118 @@ def submit_to_AAI(api_key,
 
     # Select which audio to use
     if radio == "Audio File":
-        audio_data = audio_file
+        handle = file_handle
     elif radio == "Record Audio":
-        audio_data = mic_recording
-
-    # Upload the audio
-    upload_url = upload_file(audio_data, header, is_file=False)
+        handle = mic_handle
+    else:
+        raise Exception("Streamed audio is transcribed live, select 'Audio File' or 'Record Audio' to submit")
+
+    # Upload the audio, unless this session already uploaded it
+    audio_path = store.path(session_id, handle)
+    upload_key = (api_key, handle['hash'])
+    upload_url = _run_once(uploads, upload_key,
+                           lambda: _run_job('upload_audio', header, audio_path, int(handle['sample_rate'])))
+
+    # Only in-flight jobs are kept, finished results live in the tabs' states
+    job_key = (api_key, handle['hash'], json.dumps(final_json, sort_keys=True))
+    try:
+        r, paras = _run_once(transcripts, job_key,
+                             lambda: _run_job('run_transcript', header, upload_url, final_json), keep=False)
+    except Exception:
+        # The upload may have expired or been rejected, so the next submission uploads the audio again
+        uploads.pop(upload_key, None)
+        raise
+
+    return r, paras, language
+
+
+# Transcript-only job, so the Transcript tab fills without waiting for Audio Intelligence results
+def submit_transcript(api_key,
+                      transcription_options,
+                      audio_intelligence_selector,
+                      language,
+                      radio,
+                      file_handle,
+                      mic_handle,
+                      session_id,
+                      uploads,
+                      transcripts):
+    # PII Redaction changes the transcript text, so it is kept for this job
+    text_opts = [opt for opt in audio_intelligence_selector if opt == 'PII Redaction']
+    r, paras, language = transcribe(api_key, transcription_options, text_opts, language, radio, file_handle,
+                                    mic_handle, session_id, uploads, transcripts)
+
+    paras_list = make_paras_list(paras)
+    return [get_page(paras_list, 0, PAGE_SIZE), 1, paras_list]
 
-    # Request transcript
-    transcript_response = request_transcript(upload_url, header, **final_json)
 
-    # Wait for the transcription to complete
-    polling_endpoint = make_polling_endpoint(transcript_response)
-    wait_for_completion(polling_endpoint, header)
+def submit_to_AAI(api_key,
+                  transcription_options,
+                  audio_intelligence_selector,
+                  language,
+                  radio,
+                  file_handle,
+                  mic_handle,
+                  session_id,
+                  uploads,
+                  transcripts):
+    # comment out when want to full test, for now just loading json response
+    #'''
+    r, paras, language = transcribe(api_key, transcription_options, audio_intelligence_selector, language, radio,
+                                    file_handle, mic_handle, session_id, uploads, transcripts)
+    #'''
 
-    # Fetch results JSON
-    r = requests.get(polling_endpoint, headers=header, json=final_json).json()
+    # Load from file instead so dont have to use aai key
+    #with open('../response.json', 'r') as f:
+    #    r = json.load(f)
 
-    #'''
+    # Rendering is CPU-bound, so it runs on the worker pool too
+    rendered = _run_job('render_results', r, paras, TIMELINE_BINS, PAGE_SIZE)
 
-    # TRANSCRIPT
-    # Fetch paragraphs of transcript
-    endpoint = f"https://api.assemblyai.com/v2/transcript/{r['id']}/paragraphs"
-    paras = requests.get(endpoint, headers=header)
-    paras = paras.json()['paragraphs']
+    return [language,
+            rendered['utts_page'], 1,
+            rendered['highlights_page'], 1,
+            rendered['summary_html'], rendered['topics_html'], rendered['timeline_fig'],
+            gr.Slider.update(value=0), rendered['sent'], rendered['entity_html'], rendered['content_fig'],
+            rendered['sent_results'], rendered['sent_bounds'],
+            rendered['paras_list'], rendered['para_offsets'], rendered['highlight_dict'], rendered['utts_list']]
 
-    # Format properly
-    paras = make_paras_string(paras)
 
-    # Load from file instead so dont have to use aai key
-    #with open("../paras.txt", 'r') as f:
-    #    paras = f.read()
+# Move `step` pages from `page` (1-indexed), staying within the pages of `items`
+def turn_page(page, items, step):
+    return _clamp_page(_clamp_page(page, items) + step, items)
 
-    #with open('../response.json', 'r') as f:
-    #    r = json.load(f)
 
+# Clamp a typed-in page number (1-indexed) to the pages of `items`, a cleared page box is page 1
+def _clamp_page(page, items):
+    if page is None:
+        return 1
+    return min(max(int(page), 1), get_num_pages(items, PAGE_SIZE))
 
-    # DIARIZATION
-    utts = '\n\n\n'.join([f"Speaker {utt['speaker']}:\n\n"+utt['text'] for utt in r['utterances']])
 
-    # HIGHLIGHTS
-    highlight_dict = create_highlighted_list(paras, r['auto_highlights_result']['results'])
+# Each show_*_page also returns the clamped page number, so the page box never shows a page that doesn't exist
+def show_transcript_page(page, paras_list):
+    page = _clamp_page(page, paras_list)
+    return [get_page(paras_list, page - 1, PAGE_SIZE), page]
 
-    # SUMMARIZATION'
-    chapters = r['chapters']
-    summary_html = make_summary(chapters)
 
-    # TOPIC DETECTION
-    topics = r['iab_categories_result']['summary']
-    topics_html = make_html_from_topics(topics)
+def show_diarization_page(page, utts_list):
+    page = _clamp_page(page, utts_list)
+    return [get_page(utts_list, page - 1, PAGE_SIZE, sep='\n\n\n'), page]
 
-    # SENTIMENT
-    sent_results = r['sentiment_analysis_results']
-    sent = make_sentiment_output(sent_results)
 
-    # ENTITY
-    d = make_entity_dict(r)
-    entity_html = make_entity_html(d)
+def show_highlights_page(page, paras_list, para_offsets, highlight_dict):
+    page = _clamp_page(page, paras_list)
+    return [get_highlighted_page(paras_list, para_offsets, highlight_dict, page - 1, PAGE_SIZE), page]
 
-    # CONTENT SAFETY
-    cont = r['content_safety_labels']['summary']
-    content_fig = make_content_safety_fig(cont)
 
-    return [language, paras, utts, highlight_dict, summary_html, topics_html, sent, entity_html, content_fig]
+# Load only the sentences in the selected timeline bin
+def select_sentiment_bin(bin_index, sent_results, sent_bounds):
+    return make_sentiment_window(sent_results, sent_bounds, bin_index)
 
 
-with open('styles.css', 'r') as f:
-    css = f.read()
+# Minified bundle of css-components, only rebuilt when the sources change
+css = load_css()
 
 
 with gr.Blocks(css=css) as demo:
@@ -225,10 +329,17 @@ with gr.Blocks(css=css) as demo:
     # API key textbox (password-style)
     api_key = gr.Textbox(label="", elem_id="pw")
 
-    # Gradio states for - plotly Figure object, audio data for file source, and audio data for mic source
-    plot = gr.State(px.line(labels={'x':'Time (s)', 'y':''}))
-    file_data = gr.State([1, [0]])  # [sample rate, [data]]
-    mic_data = gr.State([1, [0]])  # [Sample rate, [data]]
+    # Gradio states for - session id in the audio store, and handles to the stored file and mic audio
+    session_id = gr.State(None)
+    file_handle = gr.State(None)  # {'hash', 'sample_rate', 'duration', 'envelope'}
+    mic_handle = gr.State(None)
+
+    # Upload URL per audio, and in-flight transcript jobs per option set, shared by concurrent submissions
+    uploads = gr.State({})
+    transcripts = gr.State({})
+
+    # Real-time transcription session for streamed microphone audio
+    transcriber = gr.State(None)
 
     # TODO - fix this sequence: - US english - select all AI opts - select "Entity Detection" - go back to US english
     #   if skip selectiong "Entity Detection" works as expected
@@ -240,16 +351,27 @@ with gr.Blocks(css=css) as demo:
     current_tran_opts = gr.State([])
     current_audint_opts = gr.State([])
 
+    # Sentiment results and index bounds of each timeline bin, so a bin's sentences can be loaded on demand
+    sent_results = gr.State([])
+    sent_bounds = gr.State([0, 0])
+
+    # Paragraphs, their character offsets, highlights and utterances, so each page can be sent on its own
+    paras_list = gr.State([])
+    para_offsets = gr.State([0])
+    highlight_dict = gr.State({"text": "", "entities": [], "starts": []})
+    utts_list = gr.State([])
+
     # Selector for audio source
-    radio = gr.Radio(["Audio File", "Record Audio"], label="Audio Source", value="Audio File")
+    radio = gr.Radio(["Audio File", "Record Audio", "Stream Audio"], label="Audio Source", value="Audio File")
 
     # Audio object for both file and microphone data
     with gr.Box():
         audio_file = gr.Audio(interactive=True)
         mic_recording = gr.Audio(source="microphone", visible=False, interactive=True)
+        mic_stream = gr.Audio(source="microphone", streaming=True, visible=False, interactive=True)
 
-    # Audio wave plot
-    audio_wave = gr.Plot(plot.value)
+    # Audio wave plot - empty until audio is input, so plotly isn't imported at startup
+    audio_wave = gr.Plot()
 
     # Checkbox for transcription options
     transcription_options = gr.CheckboxGroup(
@@ -288,15 +410,29 @@ with gr.Blocks(css=css) as demo:
     # Results tab group
     with gr.Tab('Transcript'):
         trans_tab = gr.Textbox(placeholder="Your transcription will appear here ...", lines=5, max_lines=25)
+        with gr.Row():
+            trans_prev = gr.Button('Previous')
+            trans_page = gr.Number(1, precision=0, label="Page")
+            trans_next = gr.Button('Next')
     with gr.Tab('Speaker Labels'):
         diarization_tab = gr.Textbox()
+        with gr.Row():
+            diarization_prev = gr.Button('Previous')
+            diarization_page = gr.Number(1, precision=0, label="Page")
+            diarization_next = gr.Button('Next')
     with gr.Tab('Auto Highlights'):
         highlights_tab = gr.HighlightedText()
+        with gr.Row():
+            highlights_prev = gr.Button('Previous')
+            highlights_page = gr.Number(1, precision=0, label="Page")
+            highlights_next = gr.Button('Next')
     with gr.Tab('Summary'):
         summary_tab = gr.HTML()
     with gr.Tab("Detected Topics"):
         topics_tab = gr.HTML()
     with gr.Tab("Sentiment Analysis"):
+        sentiment_timeline = gr.Plot()
+        sentiment_bin = gr.Slider(minimum=0, maximum=TIMELINE_BINS - 1, step=1, value=0, label="Time Bin")
         sentiment_tab = gr.HTML()
     with gr.Tab("Entity Detection"):
         entity_tab = gr.HTML()
@@ -309,25 +445,29 @@ with gr.Blocks(css=css) as demo:
     radio.change(fn=change_audio_source,
                  inputs=[
                      radio,
-                     plot,
-                     file_data,
-                     mic_data],
+                     file_handle,
+                     mic_handle],
                  outputs=[
                      audio_file,
                      mic_recording,
-                     audio_wave,
-                     plot])
+                     mic_stream,
+                     audio_wave])
 
     # Inputting audio updates plot
     #for component in [audio_file, mic_recording]:
     #    getattr(component, 'change')(fn=plot_audio, inputs=component, outputs=audio_wave)
-    audio_file.change(fn=plot_data,
-                      inputs=[audio_file, plot],
-                      outputs=[audio_wave, file_data]
+    audio_file.change(fn=partial(plot_data, source='file'),
+                      inputs=[audio_file, session_id],
+                      outputs=[audio_wave, file_handle, session_id]
                       )
-    mic_recording.change(fn=plot_data,
-                         inputs=[mic_recording, plot],
-                         outputs=[audio_wave, mic_data])
+    mic_recording.change(fn=partial(plot_data, source='mic'),
+                         inputs=[mic_recording, session_id],
+                         outputs=[audio_wave, mic_handle, session_id])
+
+    # Streaming audio shows live partial/final transcripts in the Transcript tab
+    mic_stream.stream(fn=stream_mic,
+                      inputs=[mic_stream, api_key, transcriber],
+                      outputs=[trans_tab, transcriber])
 
     # Deselecting Automatic Language Detection shows Language Selector
     transcription_options.change(
@@ -359,23 +499,79 @@ with gr.Blocks(css=css) as demo:
         outputs=[audio_intelligence_selector, selected_audint_opts]
     )
 
+    # Submitting runs a fast transcript-only job alongside the full job, both using one upload
+    submit.click(fn=submit_transcript,
+                 inputs=[api_key,
+                         transcription_options,
+                         audio_intelligence_selector,
+                         language,
+                         radio,
+                         file_handle,
+                         mic_handle,
+                         session_id,
+                         uploads,
+                         transcripts],
+                 outputs=[trans_tab,
+                          trans_page,
+                          paras_list])
+
     submit.click(fn=submit_to_AAI,
                  inputs=[api_key,
                          transcription_options,
                          audio_intelligence_selector,
                          language,
                          radio,
-                         audio_file,
-                         mic_recording],
+                         file_handle,
+                         mic_handle,
+                         session_id,
+                         uploads,
+                         transcripts],
                  outputs=[language,
-                          trans_tab,
                           diarization_tab,
+                          diarization_page,
                           highlights_tab,
+                          highlights_page,
                           summary_tab,
                           topics_tab,
+                          sentiment_timeline,
+                          sentiment_bin,
                           sentiment_tab,
                           entity_tab,
-                          content_tab])
-
-
-demo.launch() #share=True
+                          content_tab,
+                          sent_results,
+                          sent_bounds,
+                          paras_list,
+                          para_offsets,
+                          highlight_dict,
+                          utts_list])
+
+    # Previous/Next buttons change the page number, which sends only that page to its tab
+    for page, items, prev_button, next_button in [(trans_page, paras_list, trans_prev, trans_next),
+                                                  (diarization_page, utts_list, diarization_prev, diarization_next),
+                                                  (highlights_page, paras_list, highlights_prev, highlights_next)]:
+        prev_button.click(fn=partial(turn_page, step=-1), inputs=[page, items], outputs=page)
+        next_button.click(fn=partial(turn_page, step=1), inputs=[page, items], outputs=page)
+
+    trans_page.change(fn=show_transcript_page,
+                      inputs=[trans_page, paras_list],
+                      outputs=[trans_tab, trans_page])
+    diarization_page.change(fn=show_diarization_page,
+                            inputs=[diarization_page, utts_list],
+                            outputs=[diarization_tab, diarization_page])
+    highlights_page.change(fn=show_highlights_page,
+                           inputs=[highlights_page, paras_list, para_offsets, highlight_dict],
+                           outputs=[highlights_tab, highlights_page])
+
+    # Selecting a timeline bin loads only that window's sentences
+    sentiment_bin.change(fn=select_sentiment_bin,
+                         inputs=[sentiment_bin, sent_results, sent_bounds],
+                         outputs=sentiment_tab)
+
+
+if __name__ == '__main__':
+    # Workers run in their own process group, see jobs.py
+    if WORKERS:
+        pool = start_pool(WORKERS, WORKER_THREADS, WORKER_IO_THREADS, job_store.path)
+        atexit.register(pool.terminate)
+
+    demo.launch() #share=True
@@ -1,14 +1,10 @@
 import os
+import sys
 
-css_filepaths = [f for f in os.listdir() if f.endswith(".css")]
+# Bundling is shared with app startup, see css_bundle.load_css()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from css_bundle import load_css, cache_dir
 
-css_filepaths.remove('page.css')
-css_filepaths.insert(0, 'page.css')
-
-css = ""
-for filepath in css_filepaths:
-    with open(filepath, 'r') as file:
-        css += file.read()
-
-with open("../styles.css", 'w') as f:
-    f.write(css)
\ No newline at end of file
+# Builds the cached bundle ahead of time, e.g. before the app directory is made read-only
+load_css()
+print(f"CSS bundle written to {cache_dir}")
@@ -0,0 +1,75 @@
+import glob
+import hashlib
+import os
+import re
+
+
+css_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'css-components')
+# Set AAI_CSS_CACHE to keep the bundle elsewhere, e.g. when the app directory is read-only
+cache_dir = os.environ.get('AAI_CSS_CACHE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.css-cache')
+
+
+def _css_filepaths(src_dir=css_dir):
+    """CSS sources in bundle order - page.css first, then the rest sorted by name"""
+    filepaths = sorted(glob.glob(os.path.join(src_dir, '*.css')))
+    page = os.path.join(src_dir, 'page.css')
+    if page in filepaths:
+        filepaths.remove(page)
+        filepaths.insert(0, page)
+    return filepaths
+
+
+def concat_css(src_dir=css_dir):
+    css = ""
+    for filepath in _css_filepaths(src_dir):
+        with open(filepath, 'r') as file:
+            css += file.read()
+    return css
+
+
+def minify_css(css):
+    # Remove comments and collapse whitespace
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    # Whitespace around these is never significant
+    css = re.sub(r'\s*([{};,])\s*', r'\1', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+def load_css(src_dir=css_dir, cache_dir=cache_dir):
+    """
+    Returns the minified CSS bundle, named by a hash of its sources so it is only rebuilt when they change
+
+    :param src_dir: Directory of CSS sources
+    :param cache_dir: Directory for the bundle
+    :return: Minified CSS string
+    """
+    css = concat_css(src_dir)
+    bundle_path = os.path.join(cache_dir, f"styles.{hashlib.sha256(css.encode()).hexdigest()[:16]}.min.css")
+
+    if os.path.exists(bundle_path):
+        with open(bundle_path, 'r') as f:
+            return f.read()
+
+    minified = minify_css(css)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write atomically so workers starting at the same time never read a partial bundle
+        tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(minified)
+        os.replace(tmp_path, bundle_path)
+    except OSError:
+        # A read-only cache only costs minifying on every startup
+        return minified
+
+    # Remove bundles of old sources
+    for old_path in glob.glob(os.path.join(cache_dir, 'styles.*.min.css')):
+        if old_path != bundle_path:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    return minified
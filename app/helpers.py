@@ -1,10 +1,11 @@
 import re
+from bisect import bisect_left
+from itertools import accumulate
 
+import numpy as np
 import requests
 import time
-from scipy.io.wavfile import read, write
 import io
-import plotly.express as px
 
 
 upload_endpoint = "https://api.assemblyai.com/v2/upload"
@@ -64,6 +65,9 @@ def _read_file(filename, chunk_size=5242880):
 
 # Like _read_file but for array - creates temporary unsaved "file" from sample rate and audio np.array
 def _read_array(audio, chunk_size=5242880):
+    # Imported here since scipy is slow to import and only needed for uploads
+    from scipy.io.wavfile import write
+
     sr, aud = audio
 
     # Create temporary "file" and write data to it
@@ -282,12 +286,57 @@ def make_html_from_topics(dic, threshold=0.0):
     return _make_html(tree)
 
 
-def make_paras_string(paragraphs):
+def make_paras_list(paragraphs):
     '''input = response.json()['paragraphs'] from aai paragraphs endpoint'''
-    paras = [i['text'] for i in paragraphs]
-    paras = paras + paras
-    paras = '\n\n'.join(paras)
-    return paras
+    return [i['text'] for i in paragraphs]
+
+
+def make_utterances_list(utterances):
+    '''input = response.json()['utterances']'''
+    return [f"Speaker {utt['speaker']}:\n\n" + utt['text'] for utt in utterances]
+
+
+def make_offsets(items, sep_len=2):
+    """Character offset of each item in a `sep`-joined string of `items`, so pages can be located by index"""
+    return [0] + list(accumulate(len(item) + sep_len for item in items))
+
+
+def get_num_pages(items, page_size):
+    return max(1, -(-len(items) // page_size))
+
+
+def get_page(items, page, page_size, sep='\n\n'):
+    """Joins only the items on page `page` (0-indexed)"""
+    return sep.join(items[page * page_size:(page + 1) * page_size])
+
+
+def get_highlighted_page(items, offsets, highlight_dict, page, page_size, sep='\n\n'):
+    """
+    Output of `create_highlighted_list()` for only one page of `items`, with entity spans re-based to the page
+
+    :param items: List of paragraphs that were joined with `sep` to make highlight_dict['text']
+    :param offsets: Output of `make_offsets()` for `items`
+    :param highlight_dict: Output of `create_highlighted_list()`
+    :param page: Page index (0-indexed)
+    :param page_size: Number of items per page
+    :return: Dictionary for argument `gr.HighlightedText()`
+    """
+    first = min(page * page_size, len(items))
+    last = min((page + 1) * page_size, len(items))
+    page_start = offsets[first]
+    page_end = max(offsets[last] - len(sep), page_start)
+
+    # Entities are sorted by start char, so the page's entities are a contiguous slice
+    entities = highlight_dict['entities']
+    lo = bisect_left(highlight_dict['starts'], page_start)
+    hi = bisect_left(highlight_dict['starts'], page_end)
+
+    page_entities = [{"entity": i['entity'],
+                      "start": i['start'] - page_start,
+                      "end": min(i['end'], page_end) - page_start}
+                     for i in entities[lo:hi]]
+
+    return {"text": sep.join(items[first:last]), "entities": page_entities}
 
 
 def create_highlighted_list(paragraphs_string, highlights_result, rank=0):
@@ -325,6 +374,8 @@ def create_highlighted_list(paragraphs_string, highlights_result, rank=0):
 
     # Sort entities by start char - a bug in Gradio
     highlight_dict['entities'] = sorted(highlight_dict['entities'], key=lambda x: x['start'])
+    # Keep start chars so pages can be found with a binary search
+    highlight_dict['starts'] = [i['start'] for i in highlight_dict['entities']]
 
     return highlight_dict
 
@@ -363,6 +414,68 @@ def make_sentiment_output(sentiment_analysis_results):
     return p
 
 
+def make_timeline_bins(sentiment_analysis_results, content_safety_results, n_bins=60):
+    """
+    Bins sentiment and content safety results by start time, weighting each result by its confidence
+
+    :param sentiment_analysis_results: response.json()['sentiment_analysis_results']
+    :param content_safety_results: response.json()['content_safety_labels']['results']
+    :param n_bins: Number of time bins, independent of recording length
+    :return: Bin edges (ms), dictionary of row label -> binned weights, and sentiment index bounds for each bin
+    """
+    sent_starts = np.array([s['start'] for s in sentiment_analysis_results], dtype=float)
+    sent_ends = np.array([s['end'] for s in sentiment_analysis_results], dtype=float)
+    sent_conf = np.array([s['confidence'] for s in sentiment_analysis_results], dtype=float)
+    sent_labels = np.array([s['sentiment'] for s in sentiment_analysis_results])
+
+    # Flatten content safety results to one entry per label
+    cs = [(r['timestamp']['start'], r['timestamp']['end'], l['label'], l['confidence'])
+          for r in content_safety_results for l in r['labels']]
+    cs_starts = np.array([i[0] for i in cs], dtype=float)
+    cs_ends = np.array([i[1] for i in cs], dtype=float)
+    cs_labels = np.array([i[2] for i in cs])
+    cs_conf = np.array([i[3] for i in cs], dtype=float)
+
+    # Bins span the whole recording
+    end = max(sent_ends.max(initial=0), cs_ends.max(initial=0), 1)
+    edges = np.linspace(0, end, n_bins + 1)
+
+    rows = {}
+    for sentiment in ['POSITIVE', 'NEGATIVE']:
+        mask = sent_labels == sentiment
+        rows[sentiment.title()], _ = np.histogram(sent_starts[mask], bins=edges, weights=sent_conf[mask])
+    for label in sorted(set(cs_labels)):
+        mask = cs_labels == label
+        rows[' '.join(label.split('_')).title()], _ = np.histogram(cs_starts[mask], bins=edges,
+                                                                   weights=cs_conf[mask])
+
+    # Index of the first sentence in each bin, so a window can be sliced out without searching the results again
+    bounds = np.searchsorted(sent_starts, edges)
+    bounds[-1] = len(sent_starts)
+
+    return edges, rows, bounds.tolist()
+
+
+def make_timeline_fig(edges, rows):
+    """Makes a fixed-size heatmap from an output of `make_timeline_bins()`"""
+    import plotly.graph_objects as go
+
+    timeline_fig = go.Figure(go.Heatmap(
+        z=np.array(list(rows.values())).reshape(len(rows), len(edges) - 1),
+        x=edges[:-1] / 1000,
+        y=list(rows.keys()),
+        colorscale='Reds',
+    ))
+    timeline_fig.update_xaxes(title='Time (s)')
+    return timeline_fig
+
+
+def make_sentiment_window(sentiment_analysis_results, bounds, bin_index):
+    """Makes the sentiment output for only the sentences in one bin of `make_timeline_bins()`"""
+    bin_index = min(max(int(bin_index), 0), len(bounds) - 2)
+    return make_sentiment_output(sentiment_analysis_results[bounds[bin_index]:bounds[bin_index + 1]])
+
+
 # STUFF FOR ENTITY DETECTION
 def make_entity_dict(response, offset=40):
     """input is response.json()"""
@@ -404,6 +517,8 @@ def make_entity_html(d, highlight_color="#FFFF0080"):
 
 
 def make_content_safety_fig(cont_safety_summary):
+    import plotly.express as px
+
     d = {'label': [], 'severity': []}
     for key in cont_safety_summary:
         d['label'] += [' '.join(key.split('_')).title()]
@@ -411,4 +526,18 @@ def make_content_safety_fig(cont_safety_summary):
 
     content_fig = px.bar(d, x='severity', y='label')
     content_fig.update_xaxes(range=[0, 1])
-    return content_fig
\ No newline at end of file
+    return content_fig
+
+
+def make_wave_fig(handle=None):
+    """Makes the audio wave plot from the downsampled envelope in a `SessionStore` handle"""
+    import plotly.graph_objects as go
+
+    wave_fig = go.Figure()
+    if handle is not None:
+        x = [i / handle['sample_rate'] for i in handle['envelope']['x']]
+        wave_fig.add_trace(go.Scatter(x=x, y=handle['envelope']['max'], mode='lines', line_width=0, showlegend=False))
+        wave_fig.add_trace(go.Scatter(x=x, y=handle['envelope']['min'], mode='lines', line_width=0, showlegend=False,
+                                      fill='tonexty'))
+    wave_fig.update_xaxes(title='Time (s)')
+    return wave_fig
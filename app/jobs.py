@@ -0,0 +1,291 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import closing
+
+from pipeline import upload_audio, run_transcript, render_results
+
+
+# Jobs workers may run, by name - payloads are a name and JSON arguments, never code
+JOBS = {
+    'upload_audio': upload_audio,
+    'run_transcript': run_transcript,
+    'render_results': render_results,
+}
+# Jobs that mostly wait on AssemblyAI, run on their own threads so they never hold up rendering
+IO_JOBS = ['upload_audio', 'run_transcript']
+
+# Seconds between worker heartbeats, and without one before a worker is dead and its jobs are given to another
+HEARTBEAT_INTERVAL = 5
+STALE_AFTER = 30
+# Times a job is retried after its worker died before it fails
+MAX_ATTEMPTS = 2
+
+
+def _private_dir():
+    """Per-user directory only its owner can access, so no one else can queue jobs or forge results"""
+    directory = os.path.join(tempfile.gettempdir(), f"aai-dashboard-{os.getuid() if hasattr(os, 'getuid') else ''}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if hasattr(os, 'getuid'):
+        st = os.stat(directory)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError(f"{directory} must be owned by this user and not accessible to others")
+    return directory
+
+
+def default_job_db():
+    """Shared by the front end and all workers - set AAI_JOB_DB to use another location"""
+    return os.environ.get('AAI_JOB_DB') or os.path.join(_private_dir(), 'jobs.sqlite')
+
+
+class JobStore:
+    """
+    Job queue and results in a local SQLite database, so the Gradio front end and a pool of worker processes can
+    share job state. A job is a name from `JOBS` and its JSON-serializable arguments. Workers send heartbeats, so
+    jobs of dead workers are requeued. `wait()` gives up when no worker has been alive for `queue_timeout` seconds,
+    or after `timeout`.
+    """
+
+    def __init__(self, path=None, poll_interval=0.05, max_poll_interval=0.5, queue_timeout=60, timeout=60 * 60):
+        self.path = path or default_job_db()
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        with closing(self._connect()) as conn:
+            # WAL lets the front end and idle workers read while a worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "status TEXT NOT NULL, "
+                         "name TEXT NOT NULL, "
+                         "args TEXT NOT NULL, "
+                         "result BLOB, "
+                         "error TEXT, "
+                         "attempts INTEGER NOT NULL DEFAULT 0, "
+                         "created_at REAL NOT NULL, "
+                         "queued_at REAL NOT NULL, "
+                         "claimed_at REAL, "
+                         "worker_pid INTEGER, "
+                         "heartbeat REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS workers (pid INTEGER PRIMARY KEY, heartbeat REAL NOT NULL)")
+
+    def _connect(self):
+        # A new connection per call, since Gradio runs events on many threads
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def submit(self, name, *args):
+        """Queues job `name` with `args` for a worker, returns the job id"""
+        if name not in JOBS:
+            raise ValueError(f"Unknown job: {name}")
+        with closing(self._connect()) as conn:
+            now = time.time()
+            return conn.execute("INSERT INTO jobs (status, name, args, created_at, queued_at) "
+                                "VALUES ('queued', ?, ?, ?, ?)", (name, json.dumps(args), now, now)).lastrowid
+
+    def claim(self, names=None):
+        """
+        Marks the oldest queued job as running, returns (id, name, args) or None if there is none
+
+        :param names: Names of the jobs to claim, or None for any job
+        """
+        names = list(JOBS) if names is None else list(names)
+        in_names = f"name IN ({', '.join('?' * len(names))})"
+        with closing(self._connect()) as conn:
+            # Check without the write lock first, so idle workers don't hold up writers
+            if conn.execute(f"SELECT 1 FROM jobs WHERE status = 'queued' AND {in_names} LIMIT 1",
+                            names).fetchone() is None:
+                return None
+
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(f"SELECT id, name, args FROM jobs WHERE status = 'queued' AND {in_names} "
+                               f"ORDER BY id LIMIT 1", names).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?, "
+                             "worker_pid = ?, heartbeat = ? WHERE id = ?", (now, os.getpid(), now, row[0]))
+            conn.execute("COMMIT")
+
+        if row is None:
+            return None
+        job_id, name, args = row
+        return job_id, name, json.loads(args)
+
+    def heartbeat(self, pid):
+        """Marks worker `pid` and its running jobs as alive"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)", (pid, now))
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND worker_pid = ?", (now, pid))
+
+    def _workers_alive(self, conn):
+        return conn.execute("SELECT 1 FROM workers WHERE heartbeat > ? LIMIT 1",
+                            (time.time() - STALE_AFTER,)).fetchone() is not None
+
+    def finish(self, job_id, result):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET status = 'done', result = ?, args = '' WHERE id = ? AND status = 'running'",
+                         (pickle.dumps(result), job_id))
+
+    def fail(self, job_id, error):
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET status = 'error', error = ?, args = '' WHERE id = ? AND status = 'running'",
+                         (error, job_id))
+
+    def recover(self):
+        """Requeues running jobs whose worker stopped sending heartbeats, failing those out of attempts"""
+        stale = time.time() - STALE_AFTER
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM workers WHERE heartbeat < ?", (stale,))
+            conn.execute("UPDATE jobs SET status = 'error', error = 'Worker died while running this job' "
+                         "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?", (stale, MAX_ATTEMPTS))
+            conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, queued_at = ? "
+                         "WHERE status = 'running' AND heartbeat < ?", (time.time(), stale))
+
+    def expire(self):
+        """
+        Deletes jobs no front end is waiting for any more, e.g. after it crashed. Queued jobs are only deleted while
+        no worker is alive, since a busy pool can leave jobs queued for a long time.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if not self._workers_alive(conn):
+                conn.execute("DELETE FROM jobs WHERE status = 'queued' AND queued_at < ?", (now - self.queue_timeout,))
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (now - self.timeout,))
+
+    def wait(self, job_id):
+        """Blocks until a job is done and returns its result, re-raising a failed job's error"""
+        start = time.monotonic()
+        poll_interval = self.poll_interval
+        with closing(self._connect()) as conn:
+            while True:
+                row = conn.execute("SELECT status, result, error, queued_at, heartbeat FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+                if row is None:
+                    raise Exception("Error: job expired before a worker finished it")
+                status, result, error, queued_at, heartbeat = row
+                if status in ('done', 'error'):
+                    break
+
+                # Stale long past when a running pool would have requeued it, so the whole pool is gone
+                if status == 'running' and time.time() - heartbeat > 2 * STALE_AFTER:
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    raise Exception("Error: the worker running this job died, is the worker pool running? "
+                                    "(python jobs.py)")
+
+                # Queued jobs wait as long as any worker is alive, a busy pool gets to them eventually
+                no_workers = status == 'queued' and time.time() - queued_at > self.queue_timeout and \
+                    not self._workers_alive(conn)
+                if no_workers or time.monotonic() - start > self.timeout:
+                    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    if no_workers:
+                        raise Exception(f"Error: no worker was running for {self.queue_timeout} s, "
+                                        f"is the worker pool running? (python jobs.py)")
+                    raise Exception(f"Error: job didn't finish in {self.timeout} s")
+
+                # Back off while waiting, long jobs don't need fast polling
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, self.max_poll_interval)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+        if status == 'error':
+            raise Exception(f"Error: {error}")
+        return pickle.loads(result)
+
+    def run(self, name, *args):
+        """Runs job `name` with `args` on a worker and returns its result"""
+        return self.wait(self.submit(name, *args))
+
+
+def _work(store, stopped, names=None):
+    poll_interval = store.poll_interval
+    while not stopped.is_set():
+        job = store.claim(names)
+        if job is None:
+            # Back off while the queue is empty
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, store.max_poll_interval)
+            continue
+        poll_interval = store.poll_interval
+
+        job_id, name, args = job
+        try:
+            store.finish(job_id, JOBS[name](*args))
+        except Exception:
+            # Only the frame that raised, the front end shows it to the user
+            store.fail(job_id, traceback.format_exc(limit=-1))
+
+
+def _send_heartbeats(store):
+    while True:
+        store.heartbeat(os.getpid())
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def worker(path=None, threads=4, io_threads=16):
+    """
+    Worker process - runs `threads` rendering jobs and `io_threads` jobs waiting on AssemblyAI (`IO_JOBS`) at a
+    time, so transcripts being polled never hold up rendering
+    """
+    store = JobStore(path)
+    # Never set - workers run until their process is terminated
+    stopped = threading.Event()
+    threading.Thread(target=_send_heartbeats, args=(store,), daemon=True).start()
+    cpu_jobs = [name for name in JOBS if name not in IO_JOBS]
+    for names in [cpu_jobs] * threads + [IO_JOBS] * io_threads:
+        threading.Thread(target=_work, args=(store, stopped, names), daemon=True).start()
+    stopped.wait()
+
+
+def run_pool(workers, threads=4, io_threads=16, path=None):
+    """Runs `workers` worker processes until interrupted, restarting any that die"""
+    store = JobStore(path)
+    path = store.path
+    # Running jobs left over from an earlier pool, queued ones are expired once workers are up
+    store.recover()
+
+    def start():
+        p = multiprocessing.Process(target=worker, args=(path, threads, io_threads), daemon=True)
+        p.start()
+        return p
+
+    processes = [start() for _ in range(workers)]
+    # Exit normally on terminate, so the daemon workers are stopped too
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        processes = [p if p.is_alive() else start() for p in processes]
+        store.recover()
+        store.expire()
+
+
+def start_pool(workers, threads=4, io_threads=16, path=None):
+    """Starts the worker pool in a separate process, so workers don't import the Gradio app"""
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--workers', str(workers), '--threads', str(threads), '--io-threads', str(io_threads),
+                             '--db', path or default_job_db()],
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker pool for the Audio Intelligence Dashboard")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="Rendering jobs each worker process runs at a time")
+    parser.add_argument('--io-threads', type=int, default=16,
+                        help="Upload and transcript jobs each worker process runs at a time")
+    parser.add_argument('--db', help="Path of the shared job database (default: AAI_JOB_DB or a private tmp dir)")
+    args = parser.parse_args()
+
+    run_pool(args.workers, args.threads, args.io_threads, args.db)
@@ -0,0 +1,95 @@
+import numpy as np
+import requests
+
+from helpers import upload_file, request_transcript, make_polling_endpoint, wait_for_completion, \
+    make_html_from_topics, make_paras_list, create_highlighted_list, make_summary, make_entity_dict, \
+    make_entity_html, make_content_safety_fig, make_timeline_bins, make_timeline_fig, make_sentiment_window, \
+    make_utterances_list, make_offsets, get_page, get_highlighted_page
+
+# Steps of `app.submit_to_AAI()` that don't need Gradio, so they can run in worker processes (see jobs.py)
+
+
+def upload_audio(header, audio_path, sample_rate):
+    """Uploads audio stored by `SessionStore`, returns the upload_url"""
+    return upload_file([sample_rate, np.load(audio_path)], header, is_file=False)
+
+
+def run_transcript(header, upload_url, final_json):
+    """Requests a transcript and waits for it, returns the results JSON and paragraphs"""
+    # Request transcript
+    transcript_response = request_transcript(upload_url, header, **final_json)
+
+    # Wait for the transcription to complete
+    polling_endpoint = make_polling_endpoint(transcript_response)
+    wait_for_completion(polling_endpoint, header)
+
+    # Fetch results JSON
+    r = requests.get(polling_endpoint, headers=header, json=final_json).json()
+
+    # Fetch paragraphs of transcript
+    endpoint = f"https://api.assemblyai.com/v2/transcript/{r['id']}/paragraphs"
+    paras = requests.get(endpoint, headers=header)
+    paras = paras.json()['paragraphs']
+
+    # Word timings aren't rendered and are most of the response, so don't pass them around
+    r.pop('words', None)
+    for utt in r.get('utterances') or []:
+        utt.pop('words', None)
+    for para in paras:
+        para.pop('words', None)
+
+    return r, paras
+
+
+def render_results(r, paras, n_bins, page_size):
+    """Renders the results JSON and paragraphs from `run_transcript()` for every results tab"""
+    # TRANSCRIPT
+    # Format properly - keep the list of paragraphs so the transcript can be sent one page at a time
+    paras_list = make_paras_list(paras)
+    paras = '\n\n'.join(paras_list)
+    para_offsets = make_offsets(paras_list)
+
+    # DIARIZATION
+    utts_list = make_utterances_list(r['utterances'])
+
+    # HIGHLIGHTS
+    highlight_dict = create_highlighted_list(paras, r['auto_highlights_result']['results'])
+
+    # SUMMARIZATION'
+    chapters = r['chapters']
+    summary_html = make_summary(chapters)
+
+    # TOPIC DETECTION
+    topics = r['iab_categories_result']['summary']
+    topics_html = make_html_from_topics(topics)
+
+    # SENTIMENT
+    # Binned timeline instead of one span per sentence, so render cost doesn't grow with recording length
+    sent_results = r['sentiment_analysis_results']
+    edges, rows, sent_bounds = make_timeline_bins(sent_results, r['content_safety_labels']['results'],
+                                                  n_bins=n_bins)
+    timeline_fig = make_timeline_fig(edges, rows)
+    sent = make_sentiment_window(sent_results, sent_bounds, 0)
+
+    # ENTITY
+    d = make_entity_dict(r)
+    entity_html = make_entity_html(d)
+
+    # CONTENT SAFETY
+    cont = r['content_safety_labels']['summary']
+    content_fig = make_content_safety_fig(cont)
+
+    return {'utts_page': get_page(utts_list, 0, page_size, sep='\n\n\n'),
+            'highlights_page': get_highlighted_page(paras_list, para_offsets, highlight_dict, 0, page_size),
+            'summary_html': summary_html,
+            'topics_html': topics_html,
+            'timeline_fig': timeline_fig,
+            'sent': sent,
+            'entity_html': entity_html,
+            'content_fig': content_fig,
+            'sent_results': sent_results,
+            'sent_bounds': sent_bounds,
+            'paras_list': paras_list,
+            'para_offsets': para_offsets,
+            'highlight_dict': highlight_dict,
+            'utts_list': utts_list}
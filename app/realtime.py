@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import websockets
+
+
+# Set AAI_REALTIME_URL to e.g. ws://localhost:8765 to use the stand-in server at the bottom of this file
+realtime_endpoint = os.environ.get('AAI_REALTIME_URL', "wss://api.assemblyai.com/v2/realtime/ws")
+
+
+class RealtimeTranscriber:
+    """
+    Streams microphone audio to the AssemblyAI real-time endpoint over a websocket and collects the partial and final
+    transcripts it sends back. The websocket runs on its own thread so Gradio stream events only queue audio and read
+    the latest text. The session is terminated after `idle_timeout` seconds without audio, e.g. when recording stops.
+    After an error, audio is dropped and `error` is kept so it stays visible.
+    """
+
+    def __init__(self, api_key, sample_rate=16000, endpoint=realtime_endpoint, idle_timeout=5, final=None):
+        self.api_key = api_key
+        self.sample_rate = sample_rate
+        self.url = f"{endpoint}?sample_rate={sample_rate}"
+        self.idle_timeout = idle_timeout
+
+        self.final = list(final or [])
+        self.partial = ''
+        self.error = None
+        self.last_audio = time.monotonic()
+
+        self._audio = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return not self._thread.is_alive()
+
+    @property
+    def idle_for(self):
+        """Seconds since audio was last sent"""
+        return time.monotonic() - self.last_audio
+
+    @property
+    def text(self):
+        text = ' '.join(self.final + [self.partial]).strip()
+        return text if self.error is None else f"{text}\n\nError: {self.error}"
+
+    def send(self, audio):
+        """Queues [sample rate, audio np.array] from Gradio, converted to 16 bit mono PCM at `sample_rate`"""
+        self.last_audio = time.monotonic()
+        if self.error is not None or self.closed:
+            return
+
+        sr, aud = audio
+        aud = np.asarray(aud, dtype=float)
+        if aud.ndim > 1:
+            aud = aud.mean(axis=1)
+        if len(aud) == 0:
+            return
+
+        # Linear resampling is enough for speech recognition
+        if sr != self.sample_rate:
+            n_samples = int(len(aud) * self.sample_rate / sr)
+            aud = np.interp(np.arange(n_samples) * sr / self.sample_rate, np.arange(len(aud)), aud)
+
+        self._audio.put(np.clip(aud, -32768, 32767).astype('<i2').tobytes())
+
+    def close(self):
+        self._audio.put(None)
+
+    def _run(self):
+        try:
+            asyncio.run(self._stream())
+        except Exception as e:
+            # Keep the server's error rather than the closed-connection error that follows it
+            if self.error is None:
+                self.error = str(e)
+
+    async def _stream(self):
+        async with websockets.connect(self.url, extra_headers={'Authorization': self.api_key}) as ws:
+            await asyncio.gather(self._send_loop(ws), self._receive_loop(ws))
+
+    async def _send_loop(self, ws):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                chunk = await loop.run_in_executor(None, self._audio.get, True, self.idle_timeout)
+            except queue.Empty:
+                chunk = None
+
+            if chunk is None:
+                await ws.send(json.dumps({'terminate_session': True}))
+                break
+            await ws.send(json.dumps({'audio_data': base64.b64encode(chunk).decode()}))
+
+    async def _receive_loop(self, ws):
+        async for message in ws:
+            message = json.loads(message)
+            if 'error' in message:
+                self.error = message['error']
+                break
+            elif message.get('message_type') == 'PartialTranscript':
+                self.partial = message['text']
+            elif message.get('message_type') == 'FinalTranscript':
+                if message['text']:
+                    self.final.append(message['text'])
+                self.partial = ''
+            elif message.get('message_type') == 'SessionTerminated':
+                break
+
+
+async def _stand_in_handler(ws, path=None):
+    """Speaks the real-time protocol, transcribing every message as the amount of audio received so far"""
+    await ws.send(json.dumps({'message_type': 'SessionBegins'}))
+    received = 0
+    async for message in ws:
+        message = json.loads(message)
+        if message.get('terminate_session'):
+            await ws.send(json.dumps({'message_type': 'FinalTranscript', 'text': f"[{received} bytes]"}))
+            await ws.send(json.dumps({'message_type': 'SessionTerminated'}))
+            break
+        received += len(base64.b64decode(message['audio_data']))
+        await ws.send(json.dumps({'message_type': 'PartialTranscript', 'text': f"[{received} bytes]"}))
+
+
+async def serve_stand_in(host='localhost', port=8765):
+    async with websockets.serve(_stand_in_handler, host, port):
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    # Local stand-in for the real-time endpoint, for testing without an API key
+    asyncio.run(serve_stand_in())
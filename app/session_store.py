@@ -0,0 +1,157 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+class SessionStore:
+    """
+    Keeps audio out of per-session Gradio state. Audio is written once to a content-hashed blob on disk and
+    sessions only hold a small handle (hash, sample rate, downsampled envelope). No audio is kept in memory - uploads
+    read the blob from `path()`, possibly in a worker process.
+
+    Each session keeps one blob per source (e.g. 'file' and 'mic'), so new audio replaces the session's previous
+    audio from that source. Sessions not touched for `idle_timeout` seconds are evicted on every store access and
+    every `evict_interval` seconds, and least recently used sessions are evicted while blobs take more than
+    `max_bytes`. Blobs written by this store that no remaining session uses are deleted.
+    """
+
+    def __init__(self, directory=None, idle_timeout=30 * 60, evict_interval=60, max_bytes=2 * 1024 ** 3,
+                 envelope_points=2000):
+        # A private directory per store by default, so other instances' blobs are never touched
+        self._own_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='aai-dashboard-audio-')
+        os.makedirs(self.directory, exist_ok=True)
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.envelope_points = envelope_points
+
+        self._lock = threading.Lock()
+        # session id -> (last access time, {source: hash})
+        self._sessions = {}
+        # Hash -> size of blobs this store wrote, the only ones it deletes
+        self._owned = {}
+
+        self._closed = threading.Event()
+        threading.Thread(target=self._evict_periodically, args=(evict_interval,), daemon=True).start()
+
+    def _path(self, audio_hash):
+        return os.path.join(self.directory, audio_hash + '.npy')
+
+    def put(self, session_id, audio, source='file'):
+        """Stores [sample rate, audio np.array] as a session's audio from `source`, returns its handle"""
+        sample_rate, audio_data = audio
+        audio_data = np.asarray(audio_data)
+
+        h = hashlib.sha256(str(sample_rate).encode())
+        h.update(str(audio_data.dtype).encode())
+        h.update(str(audio_data.shape).encode())
+        h.update(np.ascontiguousarray(audio_data).tobytes())
+        audio_hash = h.hexdigest()
+
+        self.evict_idle()
+        # Mark the blob as in use before writing it so a concurrent eviction can't delete it
+        with self._lock:
+            self._touch(session_id)[source] = audio_hash
+            self._owned.setdefault(audio_hash, audio_data.nbytes)
+            # The audio this replaced, and the least recently used sessions while over budget
+            self._evict_over_budget(session_id)
+            self._delete_unused()
+
+        # Identical audio from any session shares one blob
+        path = self._path(audio_hash)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, audio_data)
+            os.replace(tmp_path, path)
+
+        return {'hash': audio_hash,
+                'sample_rate': sample_rate,
+                'duration': len(audio_data) / sample_rate,
+                'envelope': make_envelope(audio_data, self.envelope_points)}
+
+    def release(self, session_id, source='file'):
+        """Forgets a session's audio from `source`, e.g. when it was cleared"""
+        with self._lock:
+            self._touch(session_id).pop(source, None)
+            self._delete_unused()
+
+    def path(self, session_id, handle):
+        """Returns the blob path for a handle returned by `put()`, e.g. for another process to load it"""
+        self.evict_idle()
+        with self._lock:
+            self._touch(session_id)
+        path = self._path(handle['hash'])
+        if not os.path.exists(path):
+            raise FileNotFoundError("Audio for this session has expired, please upload or record it again")
+        return path
+
+    def evict_idle(self):
+        """Forgets sessions idle for longer than `idle_timeout` and deletes owned blobs no remaining session uses"""
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [s for s, (t, _) in self._sessions.items() if now - t > self.idle_timeout]:
+                del self._sessions[session_id]
+            self._delete_unused()
+
+    def close(self):
+        """Stops periodic eviction and deletes this store's blobs, and its directory if the store made it"""
+        self._closed.set()
+        with self._lock:
+            self._sessions.clear()
+            self._delete_unused()
+        if self._own_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _evict_periodically(self, interval):
+        # Idle sessions are evicted even when nobody uses the store
+        while not self._closed.wait(interval):
+            self.evict_idle()
+
+    def _touch(self, session_id):
+        # Returns the session's {source: hash}, marking it as just used
+        _, sources = self._sessions.pop(session_id, (None, {}))
+        self._sessions[session_id] = (time.monotonic(), sources)
+        return sources
+
+    def _evict_over_budget(self, keep):
+        # Sessions are in order of last access, since _touch() re-inserts them
+        for session_id in list(self._sessions):
+            in_use = {h for _, sources in self._sessions.values() for h in sources.values()}
+            if sum(self._owned.get(h, 0) for h in in_use) <= self.max_bytes:
+                break
+            if session_id != keep:
+                del self._sessions[session_id]
+
+    def _delete_unused(self):
+        in_use = {h for _, sources in self._sessions.values() for h in sources.values()}
+        for audio_hash in set(self._owned) - in_use:
+            del self._owned[audio_hash]
+            try:
+                os.remove(self._path(audio_hash))
+            except FileNotFoundError:
+                pass
+
+
+def make_envelope(audio_data, n_points=2000):
+    """Downsamples audio to at most `n_points` (min, max) pairs, enough to draw the wave plot"""
+    audio_data = np.asarray(audio_data)
+    # Plot the first channel of stereo audio
+    if audio_data.ndim > 1:
+        audio_data = audio_data[:, 0]
+    if len(audio_data) == 0:
+        return {'x': [], 'min': [], 'max': []}
+
+    block = max(1, -(-len(audio_data) // n_points))
+    n_blocks = -(-len(audio_data) // block)
+    padded = np.pad(audio_data.astype(float), (0, n_blocks * block - len(audio_data)), mode='edge')
+    blocks = padded.reshape(n_blocks, block)
+
+    return {'x': (np.arange(n_blocks) * block).tolist(),
+            'min': blocks.min(axis=1).tolist(),
+            'max': blocks.max(axis=1).tolist()}
@@ -0,0 +1,46 @@
+import os
+
+from css_bundle import load_css, minify_css
+
+
+def _bundles(cache_dir):
+    return sorted(os.listdir(cache_dir))
+
+
+def test_load_css(tmp_path):
+    src_dir = tmp_path / 'src'
+    cache_dir = tmp_path / 'cache'
+    src_dir.mkdir()
+    (src_dir / 'page.css').write_text("/* page */\nbody {\n    color: red;\n}\n")
+    (src_dir / 'a.css').write_text("#pw {\n    -webkit-text-security: disc;\n}\n")
+
+    # page.css comes first, then the rest sorted
+    css = load_css(str(src_dir), str(cache_dir))
+    assert css == "body{color: red}#pw{-webkit-text-security: disc}"
+    [bundle] = _bundles(cache_dir)
+
+    # Unchanged sources are served from the cached bundle without rebuilding
+    (cache_dir / bundle).write_text("cached")
+    assert load_css(str(src_dir), str(cache_dir)) == "cached"
+
+    # Changing a source rebuilds the bundle and removes the old one
+    (src_dir / 'a.css').write_text("#pw {\n    color: blue;\n}\n")
+    css = load_css(str(src_dir), str(cache_dir))
+    assert css == "body{color: red}#pw{color: blue}"
+    [new_bundle] = _bundles(cache_dir)
+    assert new_bundle != bundle
+
+
+def test_minify_css():
+    assert minify_css("a ,b {\n  margin: 0 auto ;\n}\n/* comment */\n") == "a,b{margin: 0 auto}"
+
+
+def test_load_css_without_writable_cache(tmp_path):
+    src_dir = tmp_path / 'src'
+    src_dir.mkdir()
+    (src_dir / 'page.css').write_text("body {\n    color: red;\n}\n")
+    # Can't be created or written to, like a cache on a read-only volume
+    cache_dir = tmp_path / 'not-a-dir'
+    cache_dir.write_text("")
+
+    assert load_css(str(src_dir), str(cache_dir)) == "body{color: red}"
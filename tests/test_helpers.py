@@ -0,0 +1,101 @@
+import numpy as np
+
+from helpers import make_timeline_bins, make_sentiment_window, make_offsets, get_num_pages, get_page, \
+    get_highlighted_page, create_highlighted_list
+
+
+def _sentence(start, end, sentiment, confidence=1.0):
+    return {'start': start, 'end': end, 'sentiment': sentiment, 'confidence': confidence, 'text': f"s{start}"}
+
+
+def _window_texts(sentiments, bounds, bin_index):
+    # Sentence texts in the HTML of one timeline window
+    html = make_sentiment_window(sentiments, bounds, bin_index)
+    return [s['text'] for s in sentiments if s['text'] in html]
+
+
+def test_timeline_bins_match_sentiment_windows():
+    # Bins are 100 ms wide, s100 starts exactly on an edge and s400 exactly on the end
+    sentiments = [_sentence(0, 90, 'POSITIVE', 0.5),
+                  _sentence(100, 150, 'NEGATIVE', 0.25),
+                  _sentence(150, 290, 'NEUTRAL'),
+                  _sentence(330, 400, 'POSITIVE'),
+                  _sentence(400, 400, 'NEGATIVE')]
+    edges, rows, bounds = make_timeline_bins(sentiments, [], n_bins=4)
+
+    assert edges.tolist() == [0, 100, 200, 300, 400]
+    # Weighted by confidence, neutral sentences aren't plotted
+    assert rows['Positive'].tolist() == [0.5, 0, 0, 1]
+    assert rows['Negative'].tolist() == [0, 0.25, 0, 1]
+    assert bounds[0] == 0 and bounds[-1] == len(sentiments)
+
+    # Each window holds the sentences the histogram counted in that bin, including the edge and end cases
+    assert _window_texts(sentiments, bounds, 0) == ['s0']
+    assert _window_texts(sentiments, bounds, 1) == ['s100', 's150']
+    assert _window_texts(sentiments, bounds, 2) == []
+    assert _window_texts(sentiments, bounds, 3) == ['s330', 's400']
+
+
+def test_timeline_bins_content_safety():
+    results = [{'timestamp': {'start': 0, 'end': 500}, 'labels': [{'label': 'profanity', 'confidence': 0.5}]},
+               {'timestamp': {'start': 1500, 'end': 2000},
+                'labels': [{'label': 'hate_speech', 'confidence': 0.75},
+                           {'label': 'profanity', 'confidence': 0.25}]}]
+    edges, rows, bounds = make_timeline_bins([], results, n_bins=2)
+
+    # Bins span the content safety results when there is no sentiment analysis
+    assert edges.tolist() == [0, 1000, 2000]
+    assert rows['Profanity'].tolist() == [0.5, 0.25]
+    assert rows['Hate Speech'].tolist() == [0, 0.75]
+    assert bounds == [0, 0, 0]
+
+
+def test_timeline_bins_empty():
+    edges, rows, bounds = make_timeline_bins([], [], n_bins=4)
+
+    assert len(edges) == 5
+    assert set(rows) == {'Positive', 'Negative'}
+    assert all(np.all(row == 0) for row in rows.values())
+    assert bounds == [0] * 5
+    assert make_sentiment_window([], bounds, 2) == '<p></p>'
+
+
+def _highlighted_substrings(highlight_dict):
+    return [(e['entity'], highlight_dict['text'][e['start']:e['end']]) for e in highlight_dict['entities']]
+
+
+def test_highlighted_pages_match_full_text():
+    paras = [f"Paragraph {i} is about cats and {'dogs' if i % 2 else 'birds'}." for i in range(7)]
+    highlights = [{'text': 'cats', 'rank': 0.9}, {'text': 'dogs', 'rank': 0.5}, {'text': 'Paragraph 6', 'rank': 0.1}]
+    full = create_highlighted_list('\n\n'.join(paras), highlights)
+    offsets = make_offsets(paras)
+
+    page_size = 3
+    pages = [get_highlighted_page(paras, offsets, full, page, page_size)
+             for page in range(get_num_pages(paras, page_size))]
+
+    # The last page is partial
+    assert len(pages) == 3
+    assert pages[-1]['text'] == paras[6]
+    for page, highlighted in enumerate(pages):
+        assert highlighted['text'] == get_page(paras, page, page_size)
+
+    # Re-based spans pick out the same substrings as the full text, in order
+    assert sum([_highlighted_substrings(p) for p in pages], []) == _highlighted_substrings(full)
+    assert _highlighted_substrings(pages[-1])[0][1] == 'Paragraph 6'
+
+
+def test_highlighted_page_clips_spans_at_page_end():
+    paras = ['aaa bbb', 'ccc']
+    # A highlight running over the separator into the next page
+    full = {'text': 'aaa bbb\n\nccc',
+            'entities': [{'entity': 1, 'start': 4, 'end': 12}],
+            'starts': [4]}
+    offsets = make_offsets(paras)
+
+    first = get_highlighted_page(paras, offsets, full, 0, 1)
+    assert _highlighted_substrings(first) == [(1, 'bbb')]
+    assert get_highlighted_page(paras, offsets, full, 1, 1)['entities'] == []
+
+    # Pages past the end are empty rather than failing
+    assert get_highlighted_page(paras, offsets, full, 5, 1) == {'text': '', 'entities': []}
@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite'), queue_timeout=1)
+
+
+def _run_workers(store, n_threads, names=None):
+    # Like a worker process, but stopped at the end of the test
+    store.heartbeat(os.getpid())
+    stopped = threading.Event()
+    threads = [threading.Thread(target=jobs._work, args=(store, stopped, names), daemon=True)
+               for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    return stopped
+
+
+def test_only_known_jobs_are_queued(store):
+    with pytest.raises(ValueError):
+        store.submit('os.system', 'echo hi')
+
+
+def test_job_result_and_error(store, monkeypatch):
+    monkeypatch.setitem(jobs.JOBS, 'add', lambda a, b: a + b)
+    stopped = _run_workers(store, 1)
+    try:
+        assert store.run('add', 1, 2) == 3
+        with pytest.raises(Exception, match="TypeError"):
+            store.run('add', 1, 'a')
+    finally:
+        stopped.set()
+
+
+def test_wait_without_workers_times_out(store):
+    with pytest.raises(Exception, match="no worker was running"):
+        store.run('render_results', {}, [], 60, 10)
+
+
+def test_busy_pool_keeps_jobs_queued(store, monkeypatch):
+    monkeypatch.setitem(jobs.JOBS, 'sleep', time.sleep)
+    stopped = _run_workers(store, 1)
+    try:
+        first = store.submit('sleep', 2)
+        # Queued for longer than queue_timeout behind the first job, while the worker is alive
+        second = store.submit('sleep', 0.1)
+        store.wait(first)
+        assert store.wait(second) is None
+    finally:
+        stopped.set()
+
+
+def test_io_jobs_dont_hold_up_rendering(store, monkeypatch):
+    monkeypatch.setitem(jobs.JOBS, 'run_transcript', time.sleep)
+    monkeypatch.setitem(jobs.JOBS, 'render_results', lambda: 'rendered')
+    cpu_jobs = [name for name in jobs.JOBS if name not in jobs.IO_JOBS]
+    stopped = _run_workers(store, 1, jobs.IO_JOBS)
+    stopped_cpu = _run_workers(store, 1, cpu_jobs)
+    try:
+        store.submit('run_transcript', 2)
+        start = time.monotonic()
+        assert store.run('render_results') == 'rendered'
+        assert time.monotonic() - start < 1
+    finally:
+        stopped.set()
+        stopped_cpu.set()
+
+
+def test_job_db_is_resolved_lazily(tmp_path):
+    env = {**os.environ, 'TMPDIR': str(tmp_path)}
+    env.pop('AAI_JOB_DB', None)
+    subprocess.run([sys.executable, '-c', 'import jobs'], cwd=os.path.dirname(jobs.__file__), env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_dead_worker_jobs_are_requeued_then_failed(store, monkeypatch):
+    job_id = store.submit('render_results', {}, [], 60, 10)
+
+    def claim_and_die():
+        assert store.claim()[0] == job_id
+        # Heartbeats stopped long ago
+        with store._connect() as conn:
+            conn.execute("UPDATE jobs SET heartbeat = 0 WHERE id = ?", (job_id,))
+        store.recover()
+
+    # Requeued until it runs out of attempts
+    for _ in range(jobs.MAX_ATTEMPTS - 1):
+        claim_and_die()
+        with store._connect() as conn:
+            assert conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] == 'queued'
+    claim_and_die()
+
+    with pytest.raises(Exception, match="Worker died"):
+        store.wait(job_id)
+
+
+def test_expire_removes_orphaned_jobs(store):
+    job_id = store.submit('render_results', {}, [], 60, 10)
+    with store._connect() as conn:
+        conn.execute("UPDATE jobs SET queued_at = 0 WHERE id = ?", (job_id,))
+
+    # Kept while a worker is alive to run it
+    store.heartbeat(os.getpid())
+    store.expire()
+    assert store.claim()[0] == job_id
+    store.finish(job_id, None)
+
+    # Deleted once nothing would run it
+    job_id = store.submit('render_results', {}, [], 60, 10)
+    with store._connect() as conn:
+        conn.execute("UPDATE jobs SET queued_at = 0 WHERE id = ?", (job_id,))
+        conn.execute("UPDATE workers SET heartbeat = 0")
+    store.expire()
+    assert store.claim() is None
+
+
+def test_throughput_scales_with_workers(store, monkeypatch):
+    """Rough check that the queue doesn't serialize jobs - I/O-bound jobs, so it also holds on one core"""
+    monkeypatch.setitem(jobs.JOBS, 'sleep', time.sleep)
+
+    def run_batch(n_threads, n_jobs=8, duration=0.2):
+        stopped = _run_workers(store, n_threads)
+        start = time.monotonic()
+        job_ids = [store.submit('sleep', duration) for _ in range(n_jobs)]
+        for job_id in job_ids:
+            store.wait(job_id)
+        stopped.set()
+        return time.monotonic() - start
+
+    assert run_batch(1) / run_batch(4) > 2.5
@@ -0,0 +1,78 @@
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from realtime import RealtimeTranscriber, serve_stand_in
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(scope='module')
+def endpoint():
+    port = _free_port()
+    threading.Thread(target=asyncio.run, args=(serve_stand_in('localhost', port),), daemon=True).start()
+
+    def listening():
+        with socket.socket() as s:
+            return s.connect_ex(('localhost', port)) == 0
+    _wait_for(listening)
+    return f"ws://localhost:{port}"
+
+
+def test_partial_and_final_transcripts(endpoint):
+    transcriber = RealtimeTranscriber('key', endpoint=endpoint)
+    # 100 ms at 8 kHz, resampled to 16 kHz 16 bit mono - 3200 bytes per chunk
+    for _ in range(3):
+        transcriber.send([8000, np.zeros((800, 2))])
+    _wait_for(lambda: transcriber.partial == '[9600 bytes]')
+    assert transcriber.text == '[9600 bytes]'
+
+    transcriber.close()
+    _wait_for(lambda: transcriber.closed)
+    assert transcriber.final == ['[9600 bytes]']
+    assert transcriber.partial == ''
+    assert transcriber.error is None
+
+
+def test_idle_session_closes_without_error(endpoint):
+    transcriber = RealtimeTranscriber('key', endpoint=endpoint, idle_timeout=0.2)
+    transcriber.send([16000, np.zeros(160)])
+    _wait_for(lambda: transcriber.closed)
+
+    # What app.stream_mic uses to tell a new recording from a reconnect
+    assert transcriber.error is None
+    assert transcriber.idle_for > transcriber.idle_timeout
+
+    # Reconnecting keeps the text so far
+    reconnected = RealtimeTranscriber('key', endpoint=endpoint, final=transcriber.final)
+    reconnected.send([16000, np.zeros(160)])
+    reconnected.close()
+    _wait_for(lambda: reconnected.closed)
+    assert reconnected.final == ['[320 bytes]', '[320 bytes]']
+
+
+def test_unreachable_endpoint_keeps_error():
+    transcriber = RealtimeTranscriber('key', endpoint=f"ws://localhost:{_free_port()}")
+    _wait_for(lambda: transcriber.closed)
+    assert transcriber.error is not None
+    assert 'Error: ' in transcriber.text
+
+    # Audio is dropped rather than queued, but still counts as activity so the recording isn't restarted
+    transcriber.send([16000, np.zeros(160)])
+    assert transcriber._audio.empty()
+    assert transcriber.idle_for < transcriber.idle_timeout
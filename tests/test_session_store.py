@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from session_store import SessionStore, make_envelope
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / 'audio'), idle_timeout=0.5, evict_interval=60)
+    yield store
+    store.close()
+
+
+def _audio(seed, n=1000):
+    return [16000, np.random.default_rng(seed).integers(-1000, 1000, n, dtype=np.int16)]
+
+
+def _blobs(store):
+    return sorted(os.listdir(store.directory))
+
+
+def test_make_envelope():
+    # 10 samples in blocks of 4, the last block padded with the final sample
+    env = make_envelope(np.array([0, 5, -3, 1, 2, 9, -7, 0, 4, -1]), n_points=3)
+    assert env == {'x': [0, 4, 8], 'min': [-3, -7, -1], 'max': [5, 9, 4]}
+
+    # Short audio isn't upsampled
+    assert make_envelope(np.array([1, 2]), n_points=10) == {'x': [0, 1], 'min': [1, 2], 'max': [1, 2]}
+
+    # Stereo audio plots the first channel
+    stereo = np.array([[1, 100], [-2, 100], [3, 100]])
+    assert make_envelope(stereo, n_points=3) == {'x': [0, 1, 2], 'min': [1, -2, 3], 'max': [1, -2, 3]}
+
+    assert make_envelope(np.array([]), n_points=3) == {'x': [], 'min': [], 'max': []}
+
+
+def test_put_and_path(store):
+    audio = _audio(0)
+    handle = store.put('a', audio)
+    assert handle['sample_rate'] == 16000
+    assert handle['duration'] == 1000 / 16000
+    np.testing.assert_array_equal(np.load(store.path('a', handle)), audio[1])
+
+
+def test_identical_audio_shares_a_blob(store):
+    assert store.put('a', _audio(0))['hash'] == store.put('b', _audio(0))['hash']
+    assert len(_blobs(store)) == 1
+
+    # The blob stays while any session uses it
+    store.release('a')
+    assert len(_blobs(store)) == 1
+    store.release('b')
+    assert _blobs(store) == []
+
+
+def test_new_audio_replaces_the_source(store):
+    first = store.put('a', _audio(0))
+    mic = store.put('a', _audio(1), source='mic')
+    second = store.put('a', _audio(2))
+
+    assert _blobs(store) == sorted([mic['hash'] + '.npy', second['hash'] + '.npy'])
+    with pytest.raises(FileNotFoundError):
+        store.path('a', first)
+
+
+def test_idle_eviction_deletes_only_owned_unused_blobs(store):
+    other = os.path.join(store.directory, 'other.npy')
+    open(other, 'wb').close()
+
+    idle = store.put('idle', _audio(0))
+    time.sleep(0.3)
+    active = store.put('active', _audio(1))
+    time.sleep(0.3)
+    store.evict_idle()
+
+    assert _blobs(store) == sorted(['other.npy', active['hash'] + '.npy'])
+    with pytest.raises(FileNotFoundError):
+        store.path('idle', idle)
+
+
+def test_byte_budget_evicts_least_recently_used(tmp_path):
+    # Room for two 2000 byte blobs
+    store = SessionStore(str(tmp_path), max_bytes=4500)
+    try:
+        a = store.put('a', _audio(0))
+        b = store.put('b', _audio(1))
+        # Using a makes b the least recently used session
+        store.path('a', a)
+        c = store.put('c', _audio(2))
+
+        assert _blobs(store) == sorted([a['hash'] + '.npy', c['hash'] + '.npy'])
+        with pytest.raises(FileNotFoundError):
+            store.path('b', b)
+    finally:
+        store.close()
+
+
+def test_close_removes_its_directory():
+    store = SessionStore()
+    store.put('a', _audio(0))
+    store.close()
+    assert not os.path.exists(store.directory)
@@ -0,0 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+# Seconds allowed to import the modules app.py needs before Gradio, in a fresh interpreter
+IMPORT_BUDGET = 2.0
+
+
+def test_import_time_budget():
+    code = ("import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import helpers, pipeline, css_bundle\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))\n")
+    out = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout)
+
+    # Plotting and scipy are only imported when first used
+    assert 'plotly' not in result['modules']
+    assert 'scipy' not in result['modules']
+    assert result['elapsed'] < IMPORT_BUDGET